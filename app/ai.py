@@ -1,46 +1,391 @@
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+
 import anthropic
+import httpx
 
+from app.ratelimit import RateLimiter
 from app.settings import log, settings
 
 SYSTEM_PROMPT = """You are a film director, anthropologist, and visual historian creating cinematic video prompts for Google Veo 3 (fast mode). Your task is to generate 1 prompt in English from the provided paragraph."""
 
-client = anthropic.Anthropic(api_key=settings.anthropic_token)
+MAX_TOKENS = 512
+
+CONTEXT_PROMPT = """The manuscript the paragraphs come from is given below in <document> tags, each paragraph prefixed with its number in square brackets. Use it only to keep characters, era, setting and visual style consistent between scenes. Generate the prompt for the single paragraph in the user message."""
+
+
+def build_http_client(concurrency: int | None = None) -> httpx.Client:
+    """HTTP client with the connection pool sized for the concurrency level."""
+    if concurrency is None:
+        concurrency = settings.prompt_concurrency
+
+    return anthropic.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+            keepalive_expiry=settings.anthropic_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            settings.anthropic_read_timeout,
+            connect=settings.anthropic_connect_timeout,
+        ),
+        http2=settings.anthropic_http2,
+        proxy=f"http://{settings.proxy}" if settings.proxy else None,
+    )
+
+
+# Повторы ведёт _create_message через общий лимитер, а не SDK в обход него
+client = anthropic.Anthropic(
+    api_key=settings.anthropic_token,
+    http_client=build_http_client(),
+    max_retries=0,
+)
+
+rate_limiter = RateLimiter(
+    settings.rate_limit_db,
+    {
+        "requests": settings.anthropic_rpm,
+        "input-tokens": settings.anthropic_itpm,
+        "output-tokens": settings.anthropic_otpm,
+    },
+    headroom=settings.rate_limit_headroom,
+)
+
+
+def _estimate_input_tokens(text: str) -> int:
+    """Rough upper bound of input tokens (Cyrillic takes ~3 chars per token)."""
+    return len(text) // 3 + 1
+
+
+# Модели, у которых чтение из кэша тоже входит в ITPM (Claude 3.x, кроме 3.7)
+_CACHE_READS_COUNT = re.compile(r"claude-3-(?!7)")
+
+# Время жизни ephemeral-кэша: продлевается при каждом чтении
+CACHE_TTL = 300
+
+# Префиксы (модель, хэш контекста) → время последнего успешного запроса с ними
+_cached_prefixes: dict[tuple[str, str], float] = {}
+_cached_prefixes_lock = threading.Lock()
+
+
+def _prefix_key(model: str, context: str) -> tuple[str, str]:
+    return model, hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+def _context_cost(model: str, context: str | None) -> int:
+    """Input tokens of the context prefix that count toward the model's ITPM.
+
+    A call whose prefix is not in the cache (never written or expired) pays
+    for all of it; otherwise only models where cache reads are not free of
+    ITPM pay.
+    """
+    if not context:
+        return 0
+
+    with _cached_prefixes_lock:
+        cached_at = _cached_prefixes.get(_prefix_key(model, context))
+    cached = cached_at is not None and time.time() - cached_at < CACHE_TTL
+
+    if not cached or _CACHE_READS_COUNT.match(model):
+        return _estimate_input_tokens(CONTEXT_PROMPT + context)
+    return 0
+
+
+def _mark_cached(model: str, context: str | None) -> None:
+    """Record that the prefix is in the cache after a successful response."""
+    if not context:
+        return
+    with _cached_prefixes_lock:
+        _cached_prefixes[_prefix_key(model, context)] = time.time()
+
+
+def _system(context: str | None) -> str | list[dict]:
+    """System prompt, with the document context as a cached prefix when given."""
+    if not context:
+        return SYSTEM_PROMPT
+    return [
+        {"type": "text", "text": SYSTEM_PROMPT},
+        {
+            "type": "text",
+            "text": f"{CONTEXT_PROMPT}\n\n<document>\n{context}\n</document>",
+            "cache_control": {"type": "ephemeral"},
+        },
+    ]
+
+
+def _document_contexts(
+    paragraphs: list[str],
+    indices: list[int],
+    mode: str,
+    size: int,
+) -> dict[int, str | None]:
+    """Document context per paragraph index for context `mode` (off, full, window).
+
+    Windows of `size` paragraphs are aligned to fixed blocks so that all
+    paragraphs of a block share the same prefix and hit the same prompt
+    cache entry. A full document that would not fit the model's context
+    falls back to windows.
+    """
+    if mode == "off":
+        return dict.fromkeys(indices)
+
+    def render(start: int, end: int) -> str:
+        return "\n".join(f"[{i}] {paragraphs[i - 1]}" for i in range(start, end + 1))
+
+    if mode == "full":
+        full = render(1, len(paragraphs))
+        tokens = _estimate_input_tokens(full)
+        if tokens <= settings.document_context_max_tokens:
+            return dict.fromkeys(indices, full)
+        log.warning(
+            f"Document is ~{tokens} tokens, over document_context_max_tokens "
+            f"({settings.document_context_max_tokens}), using window mode"
+        )
+
+    windows = {}
+    contexts = {}
+    for idx in indices:
+        block = (idx - 1) // size
+        if block not in windows:
+            # Блок плюс половина соседних блоков для связности на границах
+            start = max(1, block * size + 1 - size // 2)
+            end = min(len(paragraphs), (block + 1) * size + size // 2)
+            window = render(start, end)
+            if _estimate_input_tokens(window) > settings.document_context_max_tokens:
+                log.error(f"Context window for paragraphs {start}-{end} is too large, sending without context")
+                window = None
+            windows[block] = window
+        contexts[idx] = windows[block]
+    return contexts
+
+
+def _create_message(
+    model: str,
+    paragraph: str,
+    context: str | None = None,
+) -> anthropic.types.Message | None:
+    """Call the Messages API through the shared rate limiter."""
+    costs = {
+        "requests": 1,
+        "input-tokens": (
+            _estimate_input_tokens(SYSTEM_PROMPT + paragraph) + _context_cost(model, context)
+        ),
+        # Лимит выходных токенов Anthropic оценивает по max_tokens запроса
+        "output-tokens": MAX_TOKENS,
+    }
+
+    for attempt in range(settings.rate_limit_retries + 1):
+        rate_limiter.acquire(model, costs)
+        try:
+            raw = client.messages.with_raw_response.create(
+                model=model,
+                max_tokens=MAX_TOKENS,
+                system=_system(context),
+                messages=[{"role": "user", "content": paragraph}],
+            )
+        except anthropic.RateLimitError as e:
+            rate_limiter.penalize(model, e.response.headers)
+            continue
+        except anthropic.APIStatusError as e:
+            # 529 overloaded — не InternalServerError, поэтому проверяем код
+            if e.status_code not in (408, 409) and e.status_code < 500:
+                log.error(f"API error: {e}")
+                return None
+            log.warning(f"Transient API error: {e}")
+            time.sleep(min(2 ** attempt, 30))
+            continue
+        except anthropic.APIConnectionError as e:
+            log.warning(f"Transient API error: {e}")
+            time.sleep(min(2 ** attempt, 30))
+            continue
+        except anthropic.APIError as e:
+            log.error(f"API error: {e}")
+            return None
+
+        rate_limiter.update(model, raw.headers)
+        _mark_cached(model, context)
+        return raw.parse()
+
+    log.error("API retries exhausted")
+    return None
+
+
+_REFUSAL = (
+    r"as an ai|i can't|i cannot|i can not|i'm unable|i am unable|i'm sorry|i apologi[sz]e"
+    r"|i won't|i will not"
+)
+# В начале ответа — вступления, отказы и заголовки вместо самого промпта
+_META_START_PATTERN = re.compile(
+    rf"^\s*(here is|here's|here are|sure\b|certainly|of course|okay\b|prompt:|\*\*prompt|{_REFUSAL})",
+    re.IGNORECASE,
+)
+# В остальном тексте — только вне кавычек: реплики персонажей допустимы
+_META_PATTERN = re.compile(rf"\b({_REFUSAL}|this prompt|let me know)\b", re.IGNORECASE)
+_QUOTED = re.compile(r'"[^"]*"|“[^”]*”|«[^»]*»')
+# Явный обрыв: висящая запятая/тире или служебное слово в конце
+_DANGLING_END = re.compile(
+    r"([,;:\-–—]|\b(and|or|but|with|of|the|a|an|to|in|on|at|for|from|by|as|into))\s*$",
+    re.IGNORECASE,
+)
+
+
+def validate_prompt(text: str, stop_reason: str | None = None) -> str | None:
+    """Local quality checks. Returns the failure reason, or None if the prompt is fine."""
+    text = text.strip()
+    if not text:
+        return "empty"
+    if stop_reason == "max_tokens" or _DANGLING_END.search(text):
+        return "truncated"
+    if len(text) < settings.prompt_min_chars:
+        return "too short"
+    if len(text) > settings.prompt_max_chars:
+        return "too long"
+
+    letters = [c for c in text if c.isalpha()]
+    non_ascii = sum(1 for c in letters if not c.isascii())
+    if non_ascii > len(letters) * 0.02:
+        return "not English"
+
+    plain = text.replace("’", "'")
+    if _META_START_PATTERN.search(plain) or _META_PATTERN.search(_QUOTED.sub("", plain)):
+        return "refusal or meta-commentary"
+    return None
+
+
+def _usage(message: anthropic.types.Message) -> Counter:
+    usage = message.usage
+    return Counter({
+        "input": usage.input_tokens,
+        "cache write": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "cache read": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "output": usage.output_tokens,
+    })
+
+
+def _generate(
+    paragraph: str,
+    context: str | None = None,
+    models: list[str] | None = None,
+) -> tuple[str, str, Counter]:
+    """Run the model cascade. Returns the prompt, the tier that produced it and token usage."""
+    fallback = ""
+    usage = Counter()
+    for model in models or settings.prompt_models:
+        message = _create_message(model, paragraph, context)
+        if message is None or not message.content:
+            continue
+        usage += _usage(message)
+
+        text = message.content[0].text.strip()
+        reason = validate_prompt(text, message.stop_reason)
+        if reason is None:
+            return text, model, usage
+
+        log.warning(f"{model} output rejected: {reason}")
+        fallback = text or fallback
+
+    # Ни один уровень не прошёл проверки — оставляем ответ самой сильной модели
+    return fallback, "rejected", usage
 
 
 def generate_prompt(paragraph: str) -> str:
     """Generate a Veo 3 prompt from a paragraph."""
-    try:
-        response = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=512,
-            system=SYSTEM_PROMPT,
-            messages=[{"role": "user", "content": paragraph}],
-        )
-        return response.content[0].text
-    except anthropic.APIError as e:
-        log.error(f"API error: {e}")
-        return ""
+    prompt, _, _ = _generate(paragraph)
+    return prompt
 
 
 def generate_prompts(
     paragraphs: list[str],
     indices: list[int] | None = None,
+    executor: Executor | None = None,
+    document_context: str | None = None,
+    context_window: int | None = None,
+    models: list[str] | None = None,
 ) -> dict[int, str]:
-    """Generate Veo 3 prompts for selected paragraphs."""
+    """Generate Veo 3 prompts for selected paragraphs.
+
+    A long-lived caller (the daemon) passes its own `executor` so that
+    concurrent requests share one worker pool sized to the HTTP pool,
+    and the caller's context mode, window and model cascade, which
+    otherwise default to the settings.
+    """
+    document_context = document_context or settings.document_context
+    context_window = context_window or settings.document_context_window
+    models = models or settings.prompt_models
+
     if indices is None:
         indices = list(range(1, len(paragraphs) + 1))
 
-    results = {}
     total = len(indices)
 
+    valid = []
     for count, idx in enumerate(indices, 1):
         if idx < 1 or idx > len(paragraphs):
             log.warning(f"Index {idx} out of range, skipping")
             continue
+        valid.append((count, idx))
 
+    contexts = _document_contexts(
+        paragraphs,
+        [idx for _, idx in valid],
+        document_context,
+        context_window,
+    )
+
+    def process(count: int, idx: int) -> tuple[str, str, Counter]:
         log.info(f"Processing {count}/{total} (paragraph {idx})")
-        prompt = generate_prompt(paragraphs[idx - 1])
-        results[idx] = prompt
+        paragraph = paragraphs[idx - 1]
+        context = contexts[idx]
+        if context:
+            paragraph = f"Paragraph [{idx}]:\n{paragraph}"
+        # Ошибка одного параграфа (например, SQLite лимитера) не должна терять весь прогон
+        try:
+            return _generate(paragraph, context, models)
+        except Exception as e:
+            log.error(f"Paragraph {idx} failed: {e}")
+            return "", "error", Counter()
+
+    # Первый вызов на каждый контекст записывает его в кэш,
+    # остальные отправляются после и читают префикс из кэша
+    warm_up = {}
+    if document_context != "off":
+        for count, idx in valid:
+            warm_up.setdefault(contexts[idx], (count, idx))
+
+    if executor is None:
+        pool = ThreadPoolExecutor(max_workers=settings.prompt_concurrency)
+    else:
+        pool = nullcontext(executor)
+
+    futures = {}
+    with pool as executor:
+        for count, idx in warm_up.values():
+            futures[idx] = executor.submit(process, count, idx)
+        for future in list(futures.values()):
+            future.result()
+
+        for count, idx in valid:
+            if idx not in futures:
+                futures[idx] = executor.submit(process, count, idx)
+
+    outcomes = {idx: future.result() for idx, future in futures.items()}
+    results = {idx: prompt for idx, (prompt, _, _) in outcomes.items()}
 
     log.info(f"Generated {len([p for p in results.values() if p])} prompts")
+    if outcomes:
+        tiers = Counter(tier for _, tier, _ in outcomes.values())
+        for tier in [*models, "rejected", "error"]:
+            if tiers[tier]:
+                log.info(f"  {tier}: {tiers[tier]}/{len(outcomes)} ({tiers[tier] / len(outcomes):.0%})")
+
+        usage = sum((u for _, _, u in outcomes.values()), Counter())
+        log.info(
+            f"Tokens: input {usage['input']}, cache write {usage['cache write']}, "
+            f"cache read {usage['cache read']}, output {usage['output']}"
+        )
     return results
@@ -0,0 +1,306 @@
+"""
+Долгоживущий воркер генерации промптов с JSON-RPC по Unix-сокету.
+
+Держит прогретый Anthropic-клиент (пул соединений, TLS) и кэш промптов,
+чтобы частые запуски `python -m app.main` на небольших наборах
+параграфов не платили за импорт anthropic/httpx и новый handshake.
+
+Запуск:
+    python -m app.daemon
+
+Протокол: одна строка JSON-RPC 2.0 на запрос и на ответ.
+    {"jsonrpc": "2.0", "id": 1, "method": "generate_prompts",
+     "params": {"paragraphs": [...], "indices": [1, 3], "refresh": false,
+                "document_context": "off", "context_window": 40,
+                "prompt_models": ["claude-3-haiku-20240307", ...]}}
+
+Режим контекста, окно и каскад моделей берутся из настроек клиента, а не
+демона, и входят в ключ кэша.
+"""
+
+import hashlib
+import json
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.settings import log, settings
+
+# Коды ошибок JSON-RPC 2.0
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+CONNECT_TIMEOUT = 1.0
+
+
+class PromptCache:
+    """LRU-кэш промптов по ключу из `cache_key`."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            prompt = self._items.get(key)
+            if prompt is not None:
+                self._items.move_to_end(key)
+            return prompt
+
+    def put(self, key: str, prompt: str) -> None:
+        with self._lock:
+            self._items[key] = prompt
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+def cache_key(
+    paragraphs: list[str],
+    idx: int,
+    document_context: str,
+    context_window: int,
+    models: list[str],
+) -> str:
+    """Ключ кэша: параграф, каскад моделей и, если контекст включён, весь документ."""
+    parts = [paragraphs[idx - 1], document_context, models]
+    if document_context != "off":
+        # Промпт зависит от документа и от положения параграфа в нём
+        parts += [idx, context_window, paragraphs]
+    data = json.dumps(parts, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class PromptDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        super().__init__(path, RequestHandler)
+        self.cache = PromptCache(settings.daemon_cache_size)
+        # Один пул воркеров на все подключения — по размеру пула соединений клиента
+        self.executor = ThreadPoolExecutor(max_workers=settings.prompt_concurrency)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def generate_prompts(
+        self,
+        paragraphs: list[str],
+        indices: list[int] | None = None,
+        refresh: bool = False,
+        document_context: str | None = None,
+        context_window: int | None = None,
+        models: list[str] | None = None,
+    ) -> dict[int, str]:
+        from app.ai import generate_prompts
+
+        document_context = document_context or settings.document_context
+        context_window = context_window or settings.document_context_window
+        models = models or settings.prompt_models
+
+        if indices is None:
+            indices = list(range(1, len(paragraphs) + 1))
+
+        def key(idx: int) -> str:
+            return cache_key(paragraphs, idx, document_context, context_window, models)
+
+        results = {}
+        missing = []
+        for idx in indices:
+            cached = None
+            if not refresh and 1 <= idx <= len(paragraphs):
+                cached = self.cache.get(key(idx))
+            if cached is None:
+                missing.append(idx)
+            else:
+                results[idx] = cached
+
+        log.info(f"Request: {len(indices)} paragraphs, {len(results)} from cache")
+        if missing:
+            generated = generate_prompts(
+                paragraphs,
+                missing,
+                executor=self.executor,
+                document_context=document_context,
+                context_window=context_window,
+                models=models,
+            )
+            for idx, prompt in generated.items():
+                if prompt:
+                    self.cache.put(key(idx), prompt)
+            results.update(generated)
+        return results
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: PromptDaemon
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self._dispatch(line)
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    def _dispatch(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            return _error(None, PARSE_ERROR, str(e))
+
+        if not isinstance(request, dict):
+            return _error(None, INVALID_REQUEST, "Request must be a JSON object")
+
+        request_id = request.get("id")
+        if request.get("method") != "generate_prompts":
+            return _error(request_id, METHOD_NOT_FOUND, f"Unknown method: {request.get('method')}")
+
+        params = request.get("params") or {}
+        if not isinstance(params, dict) or not isinstance(params.get("paragraphs"), list):
+            return _error(request_id, INVALID_PARAMS, "'paragraphs' must be a list")
+        if params.get("document_context", "off") not in ("off", "full", "window"):
+            return _error(request_id, INVALID_PARAMS, "'document_context' must be off, full or window")
+        indices = params.get("indices")
+        if indices is not None and not (
+            isinstance(indices, list) and all(_is_int(idx) for idx in indices)
+        ):
+            return _error(request_id, INVALID_PARAMS, "'indices' must be a list of integers or null")
+        context_window = params.get("context_window")
+        if context_window is not None and not (_is_int(context_window) and context_window > 0):
+            return _error(request_id, INVALID_PARAMS, "'context_window' must be a positive integer")
+        models = params.get("prompt_models")
+        if models is not None and not (
+            isinstance(models, list) and models and all(isinstance(m, str) for m in models)
+        ):
+            return _error(request_id, INVALID_PARAMS, "'prompt_models' must be a list of strings")
+
+        try:
+            results = self.server.generate_prompts(
+                params["paragraphs"],
+                indices,
+                bool(params.get("refresh", False)),
+                params.get("document_context"),
+                context_window,
+                models,
+            )
+        except Exception as e:
+            log.error(f"Request failed: {e}")
+            return _error(request_id, INTERNAL_ERROR, str(e))
+
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {str(idx): prompt for idx, prompt in results.items()},
+        }
+
+
+def _is_int(value) -> bool:
+    # bool — подкласс int, но индексом не является
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _error(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+# --- Client ---
+
+
+def generate_prompts_remote(
+    paragraphs: list[str],
+    indices: list[int] | None = None,
+    refresh: bool = False,
+) -> dict[int, str] | None:
+    """Генерация через запущенный демон. None — если демон недоступен."""
+    path = str(settings.daemon_socket)
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+    except OSError:
+        return None
+
+    request = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "generate_prompts",
+        "params": {
+            "paragraphs": paragraphs,
+            "indices": indices,
+            "refresh": refresh,
+            "document_context": settings.document_context,
+            "context_window": settings.document_context_window,
+            "prompt_models": settings.prompt_models,
+        },
+    }
+    try:
+        # Генерация может идти долго — ждём ответ без таймаута
+        sock.settimeout(None)
+        with sock, sock.makefile("rwb") as f:
+            f.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            response = json.loads(f.readline())
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"Daemon request failed: {e}")
+        return None
+
+    if "error" in response:
+        log.warning(f"Daemon error: {response['error']['message']}")
+        return None
+
+    log.info("Prompts generated by daemon")
+    return {int(idx): prompt for idx, prompt in response["result"].items()}
+
+
+# --- Server ---
+
+
+def _socket_in_use(path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def serve() -> None:
+    path = settings.daemon_socket
+    if path.exists():
+        if _socket_in_use(str(path)):
+            log.error(f"Daemon already running on {path}")
+            return
+        path.unlink()
+
+    # Прогрев: импорт клиента и первое соединение с API
+    from app.ai import client
+
+    try:
+        client.models.list(limit=1)
+        log.info("Anthropic connection warmed up")
+    except Exception as e:
+        log.warning(f"Warm-up request failed: {e}")
+
+    server = PromptDaemon(str(path))
+    log.info(f"Daemon listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+        log.info("Daemon stopped")
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import zlib
+from pathlib import Path
+
+from app.settings import log
+
+_MAGIC = b"VPC1"
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+
+def _entry_path(cache_dir: Path, file_path: Path, stat: os.stat_result) -> Path:
+    """Имя записи кэша по пути, размеру и mtime исходного файла."""
+    key = f"{file_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    return cache_dir / (hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".bin")
+
+
+def load_paragraphs(cache_dir: Path, file_path: Path, content: bytes) -> list[str] | None:
+    """Прочитать параграфы из кэша. None — если записи нет или она устарела."""
+    entry = _entry_path(cache_dir, file_path, file_path.stat())
+    try:
+        data = entry.read_bytes()
+    except FileNotFoundError:
+        return None
+
+    header = len(_MAGIC) + _DIGEST_SIZE
+    if data[:len(_MAGIC)] != _MAGIC or data[len(_MAGIC):header] != hashlib.sha256(content).digest():
+        return None
+
+    try:
+        payload = zlib.decompress(data[header:]).decode("utf-8")
+    except (zlib.error, UnicodeDecodeError):
+        log.warning(f"Corrupted cache entry: {entry.name}")
+        return None
+
+    # Обновляем mtime записи — для вытеснения самых старых.
+    # Запись могла быть вытеснена другим процессом — данные уже прочитаны
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    return payload.split("\0") if payload else []
+
+
+def store_paragraphs(
+    cache_dir: Path,
+    file_path: Path,
+    content: bytes,
+    paragraphs: list[str],
+    max_bytes: int,
+) -> None:
+    """Сохранить параграфы в кэш и ужать его до `max_bytes`."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entry = _entry_path(cache_dir, file_path, file_path.stat())
+
+    payload = zlib.compress("\0".join(paragraphs).encode("utf-8"))
+    tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(_MAGIC + hashlib.sha256(content).digest() + payload)
+    tmp.replace(entry)
+
+    _evict(cache_dir, max_bytes)
+
+
+def _evict(cache_dir: Path, max_bytes: int) -> None:
+    """Удалить самые старые записи, пока кэш больше `max_bytes`."""
+    entries = []
+    for path in cache_dir.glob("*.bin"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
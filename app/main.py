@@ -1,11 +1,34 @@
 import csv
 import sys
 
-from app.ai import generate_prompts
 from app.settings import log, settings
 
 
-def main(indices: list[int] | None = None, generate_videos: bool = False) -> None:
+def _generate_prompts(
+    paragraphs: list[str],
+    indices: list[int] | None,
+    refresh: bool,
+) -> dict[int, str]:
+    """Через демон, если он запущен, иначе в этом процессе."""
+    if settings.use_daemon:
+        from app.daemon import generate_prompts_remote
+
+        results = generate_prompts_remote(paragraphs, indices, refresh)
+        if results is not None:
+            return results
+
+    from app.ai import generate_prompts
+
+    return generate_prompts(paragraphs, indices)
+
+
+def main(
+    indices: list[int] | None = None,
+    generate_videos: bool = False,
+    assemble: bool = False,
+    force_assemble: bool = False,
+    refresh: bool = False,
+) -> None:
     input_files = settings.input_files()
     input_files = [f for f in input_files if f.name != ".gitkeep"]
 
@@ -16,7 +39,7 @@ def main(indices: list[int] | None = None, generate_videos: bool = False) -> Non
     input_path = input_files[0]
     paragraphs = settings.read_paragraphs(input_path)
 
-    results = generate_prompts(paragraphs, indices)
+    results = _generate_prompts(paragraphs, indices, refresh)
 
     output_path = settings.output_file(input_path.stem + ".csv")
 
@@ -33,9 +56,17 @@ def main(indices: list[int] | None = None, generate_videos: bool = False) -> Non
         log.info("Starting video generation automation...")
         from app.veo_automation import run_video_generation
 
-        run_video_generation(output_path)
+        run_video_generation(output_path, assemble=assemble, force_assemble=force_assemble)
 
 
 if __name__ == "__main__":
     generate_videos = "--generate-videos" in sys.argv or "-g" in sys.argv
-    main(generate_videos=generate_videos)
+    assemble = "--assemble" in sys.argv
+    force_assemble = "--force-assemble" in sys.argv
+    refresh = "--refresh" in sys.argv
+    main(
+        generate_videos=generate_videos,
+        assemble=assemble,
+        force_assemble=force_assemble,
+        refresh=refresh,
+    )
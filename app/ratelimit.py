@@ -0,0 +1,187 @@
+import sqlite3
+import time
+from pathlib import Path
+
+from app.settings import log
+
+# Сколько секунд лимита можно потратить разом (ёмкость корзины)
+BURST_SECONDS = 10
+# AIMD: шаг увеличения (доля лимита) на успешный ответ и множитель при 429
+INCREASE_STEP = 0.01
+DECREASE_FACTOR = 0.5
+MIN_RATE_FRACTION = 0.05
+# Все 429 в пределах окна (или retry-after) — одно событие перегрузки
+PENALTY_WINDOW = 5.0
+
+
+class RateLimiter:
+    """Token bucket, общий для всех процессов (состояние в SQLite).
+
+    На каждую пару (лимит, модель) — своя корзина, например
+    `requests:claude-3-haiku-20240307`: лимиты Anthropic считаются по
+    моделям. Скорость
+    пополнения адаптивная: растёт аддитивно на каждый успешный ответ до
+    `headroom` от лимита из заголовков `anthropic-ratelimit-*` и
+    уменьшается вдвое на 429 — не чаще раза за окно перегрузки.
+    """
+
+    def __init__(self, db_path: Path, limits: dict[str, float], headroom: float = 0.9):
+        self.db_path = db_path
+        self.limits = limits
+        self.headroom = headroom
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY,"
+                " limit_per_min REAL NOT NULL,"
+                " rate REAL NOT NULL,"
+                " level REAL NOT NULL,"
+                " updated REAL NOT NULL,"
+                " blocked_until REAL NOT NULL DEFAULT 0,"
+                " last_decrease REAL NOT NULL DEFAULT 0)"
+            )
+            try:
+                # Базы, созданные до появления колонки
+                conn.execute("ALTER TABLE buckets ADD COLUMN last_decrease REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass
+        finally:
+            conn.close()
+
+    def _buckets(self, conn: sqlite3.Connection, model: str, now: float) -> list[tuple]:
+        """Корзины модели (создаются с лимитами по умолчанию при первом обращении)."""
+        names = []
+        for kind, limit in self.limits.items():
+            name = f"{kind}:{model}"
+            rate = limit * self.headroom
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, limit_per_min, rate, level, updated)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (name, limit, rate, rate * BURST_SECONDS / 60, now),
+            )
+            names.append(name)
+        placeholders = ", ".join("?" * len(names))
+        return conn.execute(f"SELECT * FROM buckets WHERE name IN ({placeholders})", names).fetchall()
+
+    @staticmethod
+    def _refill(row: tuple, now: float) -> tuple[float, float]:
+        """Пополнить корзину на момент `now`. Возвращает (level, capacity)."""
+        _, _, rate, level, updated, _, _ = row
+        capacity = rate * BURST_SECONDS / 60
+        level = min(capacity, level + rate / 60 * max(0.0, now - updated))
+        return level, capacity
+
+    def acquire(self, model: str, costs: dict[str, float]) -> None:
+        """Блокирующее ожидание, пока во всех корзинах модели хватит ёмкости.
+
+        `costs` — стоимость запроса по видам лимитов: {"requests": 1, ...}.
+        """
+        costs = {f"{kind}:{model}": cost for kind, cost in costs.items()}
+        while True:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                rows = self._buckets(conn, model, now)
+
+                wait = 0.0
+                levels = {}
+                for row in rows:
+                    name, _, rate, _, _, blocked_until, _ = row
+                    level, capacity = self._refill(row, now)
+                    levels[name] = level
+                    wait = max(wait, blocked_until - now)
+                    # Запрос больше ёмкости корзины пропускаем при полной корзине
+                    cost = min(costs.get(name, 0), capacity)
+                    if level < cost:
+                        wait = max(wait, (cost - level) / (rate / 60))
+
+                if wait <= 0:
+                    for name, level in levels.items():
+                        level -= costs.get(name, 0)
+                        conn.execute(
+                            "UPDATE buckets SET level = ?, updated = ? WHERE name = ?",
+                            (level, now, name),
+                        )
+                    conn.execute("COMMIT")
+                    return
+
+                for name, level in levels.items():
+                    conn.execute(
+                        "UPDATE buckets SET level = ?, updated = ? WHERE name = ?",
+                        (level, now, name),
+                    )
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+
+            log.info(f"Rate limiter: waiting {wait:.1f}s")
+            time.sleep(wait)
+
+    def update(self, model: str, headers) -> None:
+        """Успешный ответ: синхронизация с заголовками и аддитивное увеличение."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            for row in self._buckets(conn, model, now):
+                name, limit, rate, _, _, _, _ = row
+                level, _ = self._refill(row, now)
+
+                kind = name.split(":", 1)[0]
+                header_limit = headers.get(f"anthropic-ratelimit-{kind}-limit")
+                if header_limit:
+                    limit = float(header_limit)
+                remaining = headers.get(f"anthropic-ratelimit-{kind}-remaining")
+                if remaining:
+                    level = min(level, float(remaining))
+
+                rate = min(limit * self.headroom, rate + limit * INCREASE_STEP)
+                conn.execute(
+                    "UPDATE buckets SET limit_per_min = ?, rate = ?, level = ?, updated = ?"
+                    " WHERE name = ?",
+                    (limit, rate, level, now, name),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def penalize(self, model: str, headers) -> None:
+        """Ответ 429: мультипликативное уменьшение и пауза по retry-after."""
+        retry_after = 0.0
+        try:
+            retry_after = float(headers.get("retry-after") or 0)
+        except ValueError:
+            pass
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            window = max(PENALTY_WINDOW, retry_after)
+            for name, limit, rate, _, _, blocked_until, last_decrease in self._buckets(conn, model, now):
+                # Остальные 429 той же волны уже учтены первым уменьшением
+                if now - last_decrease >= window:
+                    rate = max(limit * MIN_RATE_FRACTION, rate * DECREASE_FACTOR)
+                    last_decrease = now
+                blocked_until = max(blocked_until, now + retry_after)
+                conn.execute(
+                    "UPDATE buckets SET rate = ?, level = 0, updated = ?, blocked_until = ?,"
+                    " last_decrease = ? WHERE name = ?",
+                    (rate, now, blocked_until, last_decrease, name),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        log.warning(f"Rate limited on {model}, backing off (retry-after {retry_after:.0f}s)")
@@ -1,5 +1,6 @@
 import logging
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -36,12 +37,53 @@ class Settings(BaseSettings):
     google_labs_login: str
     google_labs_password: str
     proxy: str = ""
+    browser_headless: bool = False
 
     base_dir: Path = Path(__file__).resolve().parent.parent
     data_dir: Path = base_dir / "data"
     input_dir: Path = data_dir / "input"
     output_dir: Path = data_dir / "output"
 
+    # Скачивание готовых видео
+    download_videos: bool = True
+    download_timeout: int = 1800
+    download_poll_interval: int = 30
+
+    # Каскад моделей: от дешёвой к сильной, следующая — только если ответ не прошёл проверки
+    prompt_models: list[str] = ["claude-3-haiku-20240307", "claude-sonnet-4-5"]
+    prompt_min_chars: int = 80
+    prompt_max_chars: int = 2000
+
+    # Контекст документа в кэшируемом префиксе: off, full (весь документ) или window
+    document_context: Literal["off", "full", "window"] = "off"
+    document_context_window: int = 40
+    # Больше — режим full переключается на window (контекст модели 200k токенов)
+    document_context_max_tokens: int = 150_000
+
+    # Генерация промптов: параллельность и HTTP-транспорт Anthropic
+    prompt_concurrency: int = 4
+    anthropic_keepalive_expiry: float = 60.0
+    anthropic_http2: bool = False
+    anthropic_connect_timeout: float = 10.0
+    anthropic_read_timeout: float = 120.0
+
+    # Демон генерации промптов (python -m app.daemon)
+    use_daemon: bool = True
+    daemon_socket: Path = base_dir / ".daemon.sock"
+    daemon_cache_size: int = 4096
+
+    # Общий для всех процессов лимит запросов к Anthropic
+    anthropic_rpm: int = 50
+    anthropic_itpm: int = 50000
+    anthropic_otpm: int = 10000
+    rate_limit_headroom: float = 0.9
+    rate_limit_retries: int = 5
+    rate_limit_db: Path = base_dir / ".ratelimit.sqlite3"
+
+    # Кэш распарсенных .docx
+    paragraph_cache_dir: Path = base_dir / ".cache" / "paragraphs"
+    paragraph_cache_max_bytes: int = 64 * 1024 * 1024
+
     def input_files(self, pattern: str = "*") -> list[Path]:
         return sorted(self.input_dir.glob(pattern))
 
@@ -55,10 +97,27 @@ class Settings(BaseSettings):
         log.info(f"Reading file: {file_path.name}")
 
         if file_path.suffix == ".docx":
-            from docx import Document
-
-            doc = Document(file_path)
-            paragraphs = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
+            from app.doc_cache import load_paragraphs, store_paragraphs
+
+            content = file_path.read_bytes()
+            paragraphs = load_paragraphs(self.paragraph_cache_dir, file_path, content)
+
+            if paragraphs is None:
+                import io
+
+                from docx import Document
+
+                doc = Document(io.BytesIO(content))
+                paragraphs = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
+                store_paragraphs(
+                    self.paragraph_cache_dir,
+                    file_path,
+                    content,
+                    paragraphs,
+                    self.paragraph_cache_max_bytes,
+                )
+            else:
+                log.info("Paragraphs loaded from cache")
         else:
             text = file_path.read_text(encoding="utf-8")
             paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
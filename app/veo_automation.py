@@ -2,6 +2,7 @@ import asyncio
 import shutil
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urljoin
 
 from playwright.async_api import (
     BrowserContext,
@@ -21,6 +22,7 @@ from app.human import (
     simulate_reading,
 )
 from app.settings import log, settings
+from app.videos import assemble_videos, download_video, load_manifest, video_dir
 
 
 class VeoAutomation:
@@ -67,7 +69,7 @@ class VeoAutomation:
 
         launch_kwargs = {
             "user_data_dir": str(self.BROWSER_STATE_DIR),
-            "headless": False,
+            "headless": settings.browser_headless,
             "args": [
                 "--start-maximized",
                 "--disable-blink-features=AutomationControlled",
@@ -330,9 +332,77 @@ class VeoAutomation:
 
         log.info("Batch generation completed")
 
+    # --- Downloads ---
+
+    async def _find_finished_videos(self, prompts: list[tuple[int, str]]) -> dict[int, str]:
+        """Найти готовые видео на странице и сопоставить их с индексами по тексту промпта."""
+        keys = [[index, " ".join(prompt.split())] for index, prompt in prompts if prompt.strip()]
+        found = await self.page.evaluate(
+            """keys => {
+                const result = [];
+                for (const video of document.querySelectorAll('video')) {
+                    const src = video.currentSrc || video.src;
+                    if (!src) continue;
+                    // Поднимаемся от видео до ближайшего контейнера с текстом промпта.
+                    // Если совпало несколько (один промпт — часть другого), берём самый длинный
+                    for (let el = video.parentElement; el && el !== document.body; el = el.parentElement) {
+                        const text = (el.innerText || '').replace(/\\s+/g, ' ');
+                        const matches = keys.filter(([, key]) => text.includes(key));
+                        if (matches.length > 0) {
+                            const best = matches.reduce((a, b) => (b[1].length > a[1].length ? b : a));
+                            result.push([best[0], src]);
+                            break;
+                        }
+                    }
+                }
+                return result;
+            }""",
+            keys,
+        )
+        return {int(index): urljoin(self.page.url, src) for index, src in found}
+
+    async def download_finished_videos(self, prompts: list[tuple[int, str]], directory: Path):
+        """Ожидание готовых видео и их скачивание в `directory` (с докачкой по манифесту)."""
+        done = set(load_manifest(directory))
+        pending = {index for index, prompt in prompts if prompt.strip()} - done
+        log.info(f"Downloads: {len(done)} already on disk, {len(pending)} pending")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.download_timeout
+        while pending:
+            try:
+                found = await self._find_finished_videos(prompts)
+            except Exception as e:
+                log.warning(f"Could not scan page for videos: {e}")
+                found = {}
+
+            for index in sorted(pending & found.keys()):
+                url = found[index]
+                if url.startswith("blob:"):
+                    # Blob URL не появится в другом виде — ждать его бессмысленно
+                    log.error(f"Video {index} has a blob URL, cannot download")
+                    pending.discard(index)
+                    continue
+                try:
+                    # Только cookies, которые браузер отправил бы на этот URL
+                    cookies = {c["name"]: c["value"] for c in await self.context.cookies(url)}
+                    await download_video(url, directory, index, cookies)
+                    pending.discard(index)
+                except Exception as e:
+                    log.error(f"Download of video {index} failed: {e}")
 
-async def generate_videos_from_csv(csv_path: Path):
-    """Загрузка промптов из CSV и запуск генерации."""
+            if not pending:
+                break
+            if loop.time() >= deadline:
+                log.warning(f"Download timeout, missing videos: {sorted(pending)}")
+                break
+
+            log.info(f"Waiting for {len(pending)} videos...")
+            await asyncio.sleep(settings.download_poll_interval)
+
+
+def load_prompts(csv_path: Path) -> list[tuple[int, str]]:
+    """Промпты из CSV: список (index, prompt)."""
     import csv
 
     log.info(f"Reading prompts from {csv_path.name}")
@@ -346,11 +416,28 @@ async def generate_videos_from_csv(csv_path: Path):
             prompts.append((index, prompt))
 
     log.info(f"Loaded {len(prompts)} prompts")
+    return prompts
+
+
+async def generate_videos_from_csv(csv_path: Path):
+    """Загрузка промптов из CSV и запуск генерации."""
+    prompts = load_prompts(csv_path)
 
     async with VeoAutomation() as automation:
         await automation.generate_videos_batch(prompts)
+        if settings.download_videos:
+            await automation.download_finished_videos(prompts, video_dir(csv_path))
 
 
-def run_video_generation(csv_path: Path):
+def run_video_generation(csv_path: Path, assemble: bool = False, force_assemble: bool = False):
     """Синхронная обертка для запуска генерации видео."""
     asyncio.run(generate_videos_from_csv(csv_path))
+
+    if assemble or force_assemble:
+        expected = [index for index, prompt in load_prompts(csv_path) if prompt.strip()]
+        assemble_videos(
+            video_dir(csv_path),
+            settings.output_file(csv_path.stem + ".mp4"),
+            expected,
+            force=force_assemble,
+        )
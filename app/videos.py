@@ -0,0 +1,157 @@
+import csv
+import hashlib
+import shutil
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from app.settings import log, settings
+
+MANIFEST_NAME = "videos.csv"
+MANIFEST_FIELDS = ["index", "file", "sha256", "bytes", "url"]
+CHUNK_SIZE = 1024 * 1024
+MAX_REDIRECTS = 10
+
+
+def video_dir(csv_path: Path) -> Path:
+    """Директория с видео для CSV с промптами."""
+    return settings.output_dir / csv_path.stem
+
+
+def load_manifest(directory: Path) -> dict[int, dict]:
+    """Уже скачанные видео: index → запись манифеста (только существующие файлы)."""
+    manifest = directory / MANIFEST_NAME
+    if not manifest.exists():
+        return {}
+
+    records = {}
+    with manifest.open("r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if (directory / row["file"]).exists():
+                records[int(row["index"])] = row
+    return records
+
+
+def _record(directory: Path, row: dict) -> None:
+    manifest = directory / MANIFEST_NAME
+    is_new = not manifest.exists()
+    with manifest.open("a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        if is_new:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+async def download_video(url: str, directory: Path, index: int, cookies: dict[str, str]) -> dict:
+    """Потоковое скачивание видео на диск с подсчётом SHA-256 и записью в манифест.
+
+    `cookies` — cookies браузера для `url`. Редиректы обрабатываются вручную:
+    на другой хост (например, подписанный URL хранилища) cookies не уходят.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{directory.name}_{index:04d}.mp4"
+    part = path.with_suffix(".mp4.part")
+
+    origin = httpx.URL(url).host
+    cookie_header = "; ".join(f"{name}={value}" for name, value in cookies.items())
+
+    digest = hashlib.sha256()
+    size = 0
+    async with httpx.AsyncClient(
+        proxy=f"http://{settings.proxy}" if settings.proxy else None,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    ) as client:
+        target = httpx.URL(url)
+        for _ in range(MAX_REDIRECTS + 1):
+            headers = {"Cookie": cookie_header} if cookie_header and target.host == origin else {}
+            response = await client.send(client.build_request("GET", target, headers=headers), stream=True)
+            if not response.is_redirect:
+                break
+            await response.aclose()
+            target = response.url.join(response.headers["location"])
+        else:
+            raise httpx.TooManyRedirects(f"Too many redirects for {url}", request=response.request)
+
+        try:
+            response.raise_for_status()
+            with part.open("wb") as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        finally:
+            await response.aclose()
+
+    part.replace(path)
+    row = {
+        "index": index,
+        "file": path.name,
+        "sha256": digest.hexdigest(),
+        "bytes": size,
+        "url": url,
+    }
+    _record(directory, row)
+    log.info(f"Video {index} downloaded: {path.name} ({size / 1024 / 1024:.1f} MB)")
+    return row
+
+
+def assemble_videos(
+    directory: Path,
+    output_path: Path,
+    expected: list[int],
+    force: bool = False,
+) -> Path | None:
+    """Склейка скачанных видео по порядку индексов без перекодирования (ffmpeg concat).
+
+    Если каких-то индексов из `expected` нет среди скачанных, склейка
+    не выполняется — кроме `force=True`, тогда пропуски только логируются.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        log.error("ffmpeg not found, skipping assembly")
+        return None
+
+    records = load_manifest(directory)
+    if not records:
+        log.warning(f"No downloaded videos in {directory}")
+        return None
+
+    missing = sorted(set(expected) - records.keys())
+    if missing:
+        if not force:
+            log.error(f"Missing videos {missing}, not assembling (use --force-assemble to skip them)")
+            return None
+        log.warning(f"Assembling without missing videos: {missing}")
+
+    # Только индексы текущего CSV — в манифесте могут остаться видео от прошлых версий
+    indices = sorted(records.keys() & set(expected))
+    if not indices:
+        log.warning("None of the CSV videos are downloaded, nothing to assemble")
+        return None
+
+    list_path = directory / "concat.txt"
+    with list_path.open("w", encoding="utf-8") as f:
+        for index in indices:
+            file_path = (directory / records[index]["file"]).resolve()
+            escaped = str(file_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    log.info(f"Assembling {len(indices)} videos into {output_path.name}...")
+    result = subprocess.run(
+        [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0",
+            "-i", str(list_path),
+            "-c", "copy",
+            str(output_path),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        log.error(f"ffmpeg failed: {result.stderr.strip()}")
+        return None
+
+    log.info(f"Assembled video saved: {output_path}")
+    return output_path
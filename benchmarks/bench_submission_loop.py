@@ -0,0 +1,105 @@
+"""
+Headless-прогон VeoAutomation.generate_videos_batch против локальной
+заглушки Flow (benchmarks/flow_stub.py).
+
+Меряет накладные расходы цикла отправки на промпт, время восстановления
+после toast-ошибок и скачивание готовых видео. Завершается с ошибкой,
+если на заглушку дошли не те промпты (например, после изменения селекторов).
+
+    python -m benchmarks.bench_submission_loop --prompts 5 --errors 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# app.settings требует эти переменные — для бенчмарка подставляем заглушки
+for _name in ("ANTHROPIC_TOKEN", "GOOGLE_LABS_URL", "GOOGLE_LABS_LOGIN", "GOOGLE_LABS_PASSWORD"):
+    os.environ.setdefault(_name, "bench")
+
+from app.settings import log, settings  # noqa: E402
+from app.veo_automation import VeoAutomation  # noqa: E402
+from app.videos import load_manifest  # noqa: E402
+from benchmarks.flow_stub import FlowStub  # noqa: E402
+
+
+async def run(prompts: list[tuple[int, str]], workdir: Path, download: bool) -> dict:
+    automation = VeoAutomation()
+    automation.BROWSER_STATE_DIR = workdir / "browser_state"
+    # Заглушка "генерирует" мгновенно — очередь не должна ограничивать прогон
+    automation.MAX_QUEUE_SIZE = len(prompts) + 1
+
+    timings = {}
+    async with automation:
+        start = time.perf_counter()
+        await automation.generate_videos_batch(prompts)
+        timings["batch"] = time.perf_counter() - start
+
+        if download:
+            start = time.perf_counter()
+            await automation.download_finished_videos(prompts, workdir / "videos")
+            timings["download"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=5)
+    parser.add_argument("--errors", default="", help="номера отправок с ошибкой, через запятую")
+    parser.add_argument("--render-delay", type=float, default=2.0)
+    parser.add_argument("--no-download", action="store_true")
+    parser.add_argument("--headed", action="store_true", help="показать браузер")
+    args = parser.parse_args()
+
+    errors = {int(n) for n in args.errors.split(",") if n.strip()}
+    stub = FlowStub(errors, args.render_delay).start()
+
+    settings.google_labs_url = stub.url
+    settings.browser_headless = not args.headed
+    settings.download_poll_interval = 1
+    settings.download_timeout = int(args.render_delay * 10) + 30
+
+    prompts = [
+        (i, f"Stand-in prompt {i}: a cinematic wide shot of a medieval market at dawn, take {i}.")
+        for i in range(1, args.prompts + 1)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        try:
+            timings = asyncio.run(run(prompts, workdir, not args.no_download))
+        finally:
+            stub.shutdown()
+        downloaded = load_manifest(workdir / "videos")
+
+    accepted = [s["prompt"] for s in stub.submissions if not s["error"]]
+    expected = [prompt for _, prompt in prompts]
+    failed = sum(1 for s in stub.submissions if s["error"])
+
+    print(f"prompts:            {len(prompts)}")
+    print(f"submissions:        {len(stub.submissions)} ({failed} scripted errors)")
+    print(f"outputs per prompt: {stub.outputs_per_prompt}")
+    print(f"batch time:         {timings['batch']:.1f}s")
+    print(f"per prompt:         {timings['batch'] / len(prompts):.2f}s")
+    if "download" in timings:
+        print(f"downloaded:         {len(downloaded)}/{len(prompts)} in {timings['download']:.1f}s")
+
+    problems = []
+    if accepted != expected:
+        problems.append("accepted prompts differ from the batch (empty paste or selector regression?)")
+    if stub.outputs_per_prompt != "1":
+        problems.append("outputs per prompt was not set to 1")
+    if "download" in timings and len(downloaded) != len(prompts):
+        problems.append("not all videos were downloaded")
+
+    for problem in problems:
+        log.error(problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Бенчмарк HTTP-транспорта Anthropic-клиента против локального стенда.
+
+Стенд отвечает на POST /v1/messages фиксированным сообщением и умеет
+имитировать стоимость установки соединения (TCP + TLS до API) задержкой
+на каждое новое подключение. Сравниваются:
+- cold: новый клиент на каждый запрос (соединение каждый раз заново)
+- pooled: один клиент из app.ai.build_http_client с keep-alive пулом
+
+    python -m benchmarks.bench_transport --requests 200 --concurrency 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# app.settings требует эти переменные — для бенчмарка подставляем заглушки
+for _name in ("ANTHROPIC_TOKEN", "GOOGLE_LABS_URL", "GOOGLE_LABS_LOGIN", "GOOGLE_LABS_PASSWORD"):
+    os.environ.setdefault(_name, "bench")
+
+import anthropic  # noqa: E402
+
+from app.ai import build_http_client  # noqa: E402
+
+_RESPONSE = json.dumps({
+    "id": "msg_bench",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-3-haiku-20240307",
+    "content": [{"type": "text", "text": "A cinematic wide shot of a misty valley at dawn."}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 100, "output_tokens": 20},
+}).encode("utf-8")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными send — без этого Nagle + delayed ACK добавляют ~40 ms
+    disable_nagle_algorithm = True
+    handshake_delay = 0.0
+    response_delay = 0.0
+    connections = 0
+    _lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler._lock:
+            StandInHandler.connections += 1
+        time.sleep(self.handshake_delay)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.response_delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _request(client: anthropic.Anthropic) -> float:
+    start = time.perf_counter()
+    client.messages.create(
+        model="claude-3-haiku-20240307",
+        max_tokens=512,
+        messages=[{"role": "user", "content": "bench"}],
+    )
+    return time.perf_counter() - start
+
+
+def run(mode: str, base_url: str, requests: int, concurrency: int) -> list[float]:
+    pooled = anthropic.Anthropic(
+        api_key="bench",
+        base_url=base_url,
+        max_retries=0,
+        http_client=build_http_client(concurrency),
+    )
+
+    def one(_: int) -> float:
+        if mode == "pooled":
+            return _request(pooled)
+        with anthropic.Anthropic(api_key="bench", base_url=base_url, max_retries=0) as cold:
+            return _request(cold)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(requests)))
+    pooled.close()
+    return latencies
+
+
+def report(mode: str, latencies: list[float], connections: int, elapsed: float) -> None:
+    ms = sorted(t * 1000 for t in latencies)
+    q = statistics.quantiles(ms, n=100)
+    print(
+        f"{mode:>6}: {len(ms) / elapsed:7.1f} req/s | connections {connections:4d} | "
+        f"mean {statistics.fmean(ms):6.1f} ms | p50 {q[49]:6.1f} | "
+        f"p95 {q[94]:6.1f} | p99 {q[98]:6.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--handshake-ms", type=float, default=30.0, help="имитация TCP+TLS на подключение")
+    parser.add_argument("--response-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    # Лог каждого запроса httpx на INFO заглушает отчёт
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    StandInHandler.handshake_delay = args.handshake_ms / 1000
+    StandInHandler.response_delay = args.response_ms / 1000
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        for mode in ("cold", "pooled"):
+            StandInHandler.connections = 0
+            start = time.perf_counter()
+            latencies = run(mode, base_url, args.requests, args.concurrency)
+            report(mode, latencies, StandInHandler.connections, time.perf_counter() - start)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Локальный сервер-заглушка Google Flow (см. flow_stub.html).
+
+Сервер хранит состояние между перезагрузками страницы и восстановлением
+браузера: отправленные промпты, плитки и "генерацию" видео. Ошибки
+задаются номерами отправок (с 1), на которых страница покажет Sonner toast.
+
+    python -m benchmarks.flow_stub --errors 2,5
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PAGE = (Path(__file__).parent / "flow_stub.html").read_bytes()
+ERROR_MESSAGE = "Something went wrong. Please try again."
+MEDIA_SIZE = 256 * 1024
+
+
+class FlowStub(ThreadingHTTPServer):
+    """Состояние заглушки: отправки, плитки и сценарий ошибок."""
+
+    daemon_threads = True
+
+    def __init__(self, errors: set[int] | None = None, render_delay: float = 2.0, port: int = 0):
+        super().__init__(("127.0.0.1", port), FlowStubHandler)
+        self.errors = errors or set()
+        self.render_delay = render_delay
+        self.submissions: list[dict] = []
+        self.tiles: list[dict] = []
+        self.outputs_per_prompt: str | None = None
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/fx/tools/flow"
+
+    def start(self) -> "FlowStub":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def submit(self, prompt: str) -> dict:
+        with self.lock:
+            number = len(self.submissions) + 1
+            failed = number in self.errors
+            self.submissions.append({"number": number, "prompt": prompt, "error": failed, "at": time.time()})
+            if failed:
+                return {"error": ERROR_MESSAGE}
+            tile = {"id": len(self.tiles) + 1, "prompt": prompt, "ready_at": time.time() + self.render_delay}
+            self.tiles.append(tile)
+            return {"tile": self._public(tile)}
+
+    def tiles_snapshot(self) -> list[dict]:
+        with self.lock:
+            return [self._public(t) for t in self.tiles]
+
+    @staticmethod
+    def _public(tile: dict) -> dict:
+        ready_in = max(0.0, tile["ready_at"] - time.time())
+        return {"id": tile["id"], "prompt": tile["prompt"], "ready_in_ms": int(ready_in * 1000)}
+
+
+class FlowStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FlowStub
+
+    def _send(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data) -> None:
+        self._send(json.dumps(data).encode("utf-8"), "application/json")
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if self.path == "/api/tiles":
+            self._send_json(self.server.tiles_snapshot())
+            return
+
+        media = re.fullmatch(r"/media/(\d+)\.mp4", self.path)
+        if media:
+            tile_id = int(media.group(1))
+            seed = tile_id.to_bytes(4, "big")
+            body = (seed * (MEDIA_SIZE // len(seed)))[:MEDIA_SIZE]
+            self._send(body, "video/mp4")
+            return
+
+        if self.path == "/favicon.ico":
+            self._send(b"", "image/x-icon", status=404)
+            return
+
+        self._send(PAGE, "text/html; charset=utf-8")
+
+    def do_POST(self):
+        if self.path == "/api/submit":
+            prompt = json.loads(self._read_body() or b"{}").get("prompt", "")
+            self._send_json(self.server.submit(prompt))
+        elif self.path == "/api/outputs":
+            self.server.outputs_per_prompt = self._read_body().decode("utf-8")
+            self._send_json({"ok": True})
+        else:
+            self._send_json({"error": "not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--errors", default="", help="номера отправок с ошибкой, через запятую")
+    parser.add_argument("--render-delay", type=float, default=2.0, help="секунд до появления видео")
+    args = parser.parse_args()
+
+    errors = {int(n) for n in args.errors.split(",") if n.strip()}
+    server = FlowStub(errors, args.render_delay, args.port)
+    print(f"Flow stub: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
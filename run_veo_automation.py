@@ -23,8 +23,12 @@ def find_latest_csv() -> Path | None:
 
 def main():
     """Главная функция."""
-    if len(sys.argv) > 1:
-        csv_path = Path(sys.argv[1])
+    assemble = "--assemble" in sys.argv
+    force_assemble = "--force-assemble" in sys.argv
+    args = [a for a in sys.argv[1:] if a not in ("--assemble", "--force-assemble")]
+
+    if args:
+        csv_path = Path(args[0])
 
         if not csv_path.exists():
             log.error(f"CSV file not found: {csv_path}")
@@ -48,7 +52,7 @@ def main():
     log.info("Starting Veo automation...")
 
     try:
-        run_video_generation(csv_path)
+        run_video_generation(csv_path, assemble=assemble, force_assemble=force_assemble)
         log.info("✓ Video generation completed successfully")
     except KeyboardInterrupt:
         log.warning("Video generation interrupted by user")